@@ -1,423 +1,671 @@
 #!/usr/bin/env python3
 """
-Flask Server for MorphDetect Backend
+Quart (ASGI) Server for MorphDetect Backend
 Integrates with SelfMAD morph detection model
 """
 
 import os
-import json
-import base64
+import sys
+import asyncio
+import bisect
+import functools
+import gzip
+import shutil
+import threading
+from collections import deque
+from tempfile import SpooledTemporaryFile
 from datetime import datetime
-from flask import Flask, request, jsonify, send_from_directory
-from flask_cors import CORS
-from werkzeug.utils import secure_filename
+import orjson
+from quart import Quart, request, make_response, send_from_directory
+from quart_cors import cors
+from werkzeug.exceptions import BadRequest
+import secrets
+import hashlib
 import uuid
+import queue
+import atexit
 import logging
+from logging.handlers import QueueHandler, QueueListener
 from pathlib import Path
 
+# Brotli is preferred for response compression but optional
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# SIMD (SSSE3/AVX2) base64 decoder when available; same signature as stdlib
+try:
+    from pybase64 import b64decode
+except ImportError:
+    from base64 import b64decode
+
 # Import configuration
 from config import get_config
+from inference import (
+    MAX_BATCH, create_pool, start_dispatcher, stop_dispatcher, submit_detection, _worker_ready
+)
 
-# Import your morph detection model
+# Check the morph detection model imports; the detector itself is built
+# inside each inference worker process
 try:
-    from morph_detect_selfmad_official import SelfMADOfficialDetector
+    import morph_detect_selfmad_official  # noqa: F401
     MODEL_AVAILABLE = True
 except ImportError as e:
     print(f"⚠️  Warning: Morph detection model not available: {e}")
     MODEL_AVAILABLE = False
 
-# Module-level detector instance referenced by route handlers and startup initializer
-detector = None
+# Module-level inference pool referenced by route handlers; started and
+# stopped with the server so every ASGI worker owns exactly one pool
+POOL = None
+MODEL_READY = False
+# Caps requests in flight to the pool; created on the serving event loop
+INFER_SEM = None
+
+# Most recent analysis summaries (newest first). history.jsonl on disk is an
+# append-only log; this deque is what /api/history serves.
+HISTORY_LIMIT = 100
+HISTORY = deque(maxlen=HISTORY_LIMIT)
+HISTORY_LOCK = threading.Lock()
+# Pre-serialized /api/history body, rebuilt only when HISTORY changes
+HISTORY_BYTES = orjson.dumps({'status': 'success', 'history': []})
+
+
+# Pending history.jsonl lines, drained by one background writer thread
+WRITE_Q = queue.Queue(maxsize=10000)
+WRITE_BATCH = 1000
+
+
+def _refresh_history_bytes():
+    """Re-serialize the cached history body; call with HISTORY_LOCK held"""
+    global HISTORY_BYTES
+    HISTORY_BYTES = orjson.dumps({'status': 'success', 'history': list(HISTORY)})
 
-# Configure logging
-logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+
+class _DeferredQueueHandler(QueueHandler):
+    """QueueHandler that leaves message formatting to the listener thread"""
+
+    def prepare(self, record):
+        # Records stay in-process, so there is no need to pre-format them
+        # for pickling; the listener's handlers format them off the hot path
+        return record
+
+
+# Risk levels by prob_morphed: >= 0.9 CRITICAL, >= 0.75 HIGH, >= 0.5 MEDIUM
+_RISK_THRESHOLDS = (0.5, 0.75, 0.9)
+_RISK_LEVELS = ('LOW', 'MEDIUM', 'HIGH', 'CRITICAL')
+
+
+def risk_level_for(prob):
+    """Map the probability of MORPHED to a risk level"""
+    return _RISK_LEVELS[bisect.bisect_right(_RISK_THRESHOLDS, prob)]
+
+
+def _build_response(result, filename):
+    """Turn a detector result into the API response and its history summary"""
+    # Compute confidence from prob_morphed (probability of MORPHED)
+    prob = float(result.get('prob_morphed', 0.0))
+    # For display, convert to a percentage and scale sensibly
+    confidence_pct = round(prob * 100.0, 1)
+    risk_level = risk_level_for(prob)
+
+    # Identity and timestamp are computed once and shared by the
+    # response and the history summary
+    analysis_id = str(uuid.uuid4())
+    now_iso = datetime.now().isoformat()
+    class_name = result.get('class_name')
+
+    analysis_result = {
+        'status': 'success',
+        'analysis_id': analysis_id,
+        'timestamp': now_iso,
+        'filename': filename,
+        'result': {
+            'raw_logit': result.get('raw_logit'),
+            'predicted_class': result.get('predicted_class'),
+            'class_name': class_name,
+            'confidence': confidence_pct,
+            'model': result.get('model')
+        },
+        'interpretation': {
+            # If predicted_class == 1, model sees MORPHED
+            'is_morphed': result.get('predicted_class') == 1,
+            'risk_level': risk_level
+        }
+    }
+    summary = {
+        'analysis_id': analysis_id,
+        'timestamp': now_iso,
+        'filename': filename,
+        'class_name': class_name,
+        'confidence': confidence_pct,
+        'risk_level': risk_level,
+        'regions': result.get('regions', []),
+        'processing_time_ms': result.get('processing_time_ms', 0),
+        'thumbnail_url': f"/uploads/{filename}"
+    }
+    return analysis_result, summary
+
+
+@functools.lru_cache(maxsize=16)
+def _compress_body(algorithm, body, level):
+    """Compress a response body; cached so the unchanged history blob is
+    only re-compressed when it is rebuilt"""
+    if algorithm == 'br':
+        return brotli.compress(body, quality=level)
+    return gzip.compress(body, compresslevel=level)
+
+
+def _write_all(fd, data):
+    """Write a bytes-like object straight to a raw fd (no io buffer copy)"""
+    with memoryview(data) as view:
+        written = 0
+        while written < len(view):
+            written += os.write(fd, view[written:])
+
+
+def configure_logging(config):
+    """Send log records through a queue so request handlers never touch the log file"""
+    os.makedirs(Path(config.LOG_FILE).parent, exist_ok=True)
+    formatter = logging.Formatter('%(asctime)s %(levelname)s %(name)s: %(message)s')
+    handlers = [logging.FileHandler(config.LOG_FILE, encoding='utf-8'), logging.StreamHandler()]
+    for handler in handlers:
+        handler.setFormatter(formatter)
+
+    log_queue = queue.SimpleQueue()
+    root = logging.getLogger()
+    # Third-party libraries stay at INFO; LOG_LEVEL only applies to this app's
+    # logger, whose records still reach the root handlers through propagation
+    root.setLevel(logging.INFO)
+    logger.setLevel(config.LOG_LEVEL)
+    root.handlers[:] = [_DeferredQueueHandler(log_queue)]
+    listener = QueueListener(log_queue, *handlers, respect_handler_level=True)
+    listener.start()
+    atexit.register(listener.stop)
+
 def create_app(config_name=None):
     """Application factory pattern"""
-    app = Flask(__name__)
+    app = Quart(__name__)
     
     # Load configuration
     config = get_config()
     app.config.from_object(config)
+    configure_logging(config)
     
     # Enable CORS
-    CORS(app, origins=config.CORS_ORIGINS)
+    app = cors(app, allow_origin=config.CORS_ORIGINS)
+
+    def ojsonify(obj):
+        """jsonify replacement backed by orjson (compact, much faster encode)"""
+        return app.response_class(orjson.dumps(obj), mimetype='application/json')
+
+    # Response compression (Quart counterpart of flask-compress)
+    compress_algorithms = [
+        algorithm for algorithm in config.COMPRESS_ALGORITHM
+        if algorithm != 'br' or brotli is not None
+    ]
+    compress_levels = {'br': config.COMPRESS_BR_LEVEL, 'gzip': config.COMPRESS_LEVEL}
+
+    @app.after_request
+    async def compress_response(response):
+        """Brotli/gzip-encode JSON bodies for clients that accept it"""
+        if (response.mimetype not in config.COMPRESS_MIMETYPES
+                or not 200 <= response.status_code < 300
+                or 'Content-Encoding' in response.headers
+                or (response.content_length or 0) < config.COMPRESS_MIN_SIZE):
+            return response
+
+        accepted = request.accept_encodings
+        algorithm = next((a for a in compress_algorithms if accepted[a] > 0), None)
+        response.vary.add('Accept-Encoding')
+        if algorithm is None:
+            return response
+
+        body = await response.get_data()
+        response.set_data(_compress_body(algorithm, body, compress_levels[algorithm]))
+        response.headers['Content-Encoding'] = algorithm
+        return response
     
     # Create necessary directories
     os.makedirs(config.UPLOAD_FOLDER, exist_ok=True)
     os.makedirs('logs', exist_ok=True)
     os.makedirs('temp', exist_ok=True)
     
-    # Note: detector is a module-level variable (see above). We do not
-    # create a separate local detector here so that routes reference the
-    # same instance that may be initialized at module startup.
-    
-    def allowed_file(filename):
-        """Check if file extension is allowed"""
-        return '.' in filename and \
-               filename.rsplit('.', 1)[1].lower() in config.ALLOWED_EXTENSIONS
-
-    def initialize_model():
-        """Initialize the morph detection model"""
-        # Use the module-level detector so initialization is visible to
-        # route handlers and to the __main__ startup initializer.
-        global detector
+    # Extension allow-list, resolved once instead of on every request
+    allowed_extensions = frozenset(config.ALLOWED_EXTENSIONS)
+    allowed_extensions_text = ', '.join(sorted(allowed_extensions))
+
+    def upload_extension(filename):
+        """Return the lower-cased extension of an allow-listed upload name"""
+        # A plain allow-list check is enough: the stored file is renamed to
+        # a UUID, so secure_filename's sanitising pass would be wasted work
+        _, dot, file_extension = filename.rpartition('.')
+        file_extension = file_extension.lower()
+        if not dot or file_extension not in allowed_extensions:
+            raise BadRequest(f'File type not allowed. Allowed types: {allowed_extensions_text}')
+        return file_extension
+
+    @app.before_serving
+    async def start_inference_pool():
+        """Spawn the inference workers and wait for their models to load"""
+        global POOL, MODEL_READY, INFER_SEM
         if not MODEL_AVAILABLE:
             logger.warning("⚠️  Model not available - running in demo mode")
-            return False
+            return
 
         try:
-            logger.info("🔧 Initializing SelfMAD morph detection model...")
-            detector = SelfMADOfficialDetector(config.MODEL_PATH, config.MODEL_TYPE)
-            logger.info("✅ Model initialized successfully!")
-            return True
+            logger.info(f"🔧 Starting {config.WORKERS} SelfMAD inference workers...")
+            POOL = create_pool(config.MODEL_PATH, config.MODEL_TYPE, config.WORKERS)
+            # One probe per worker forces every process to spawn and load now
+            # rather than on the first real request
+            ready = await asyncio.gather(*(
+                asyncio.wrap_future(POOL.submit(_worker_ready))
+                for _ in range(max(1, config.WORKERS))
+            ))
+            start_dispatcher(POOL)
+            # Enough permits to keep every worker's batch full; beyond that,
+            # requests wait on the event loop instead of piling up in REQ_Q
+            INFER_SEM = asyncio.Semaphore(max(1, config.WORKERS) * MAX_BATCH)
+            MODEL_READY = all(ready)
+            if MODEL_READY:
+                logger.info("✅ Model initialized successfully!")
+            else:
+                logger.error("❌ Failed to initialize model in one or more workers")
         except Exception as e:
             logger.error(f"❌ Failed to initialize model: {e}")
-            return False
+            logger.info("⚠️  Server will start in demo mode")
 
-    # Expose the initializer via app.config to avoid assigning new attributes
-    # directly on the Flask object (Pylance will warn about that).
-    app.config['INITIALIZE_MODEL_FUNC'] = initialize_model
+    @app.after_serving
+    async def stop_inference_pool():
+        """Shut the inference workers down with the server"""
+        global POOL, MODEL_READY
+        MODEL_READY = False
+        if POOL is not None:
+            stop_dispatcher()
+            POOL.shutdown(wait=True, cancel_futures=True)
+            POOL = None
+
+    async def run_detection(source):
+        """Run detection in the worker pool without blocking the event loop"""
+        async with INFER_SEM:
+            return await asyncio.wait_for(
+                asyncio.wrap_future(submit_detection(source)),
+                timeout=config.INFERENCE_TIMEOUT
+            )
+
+    # Stable paths resolved to plain strings once, not rebuilt per request
+    upload_dir = config.UPLOAD_FOLDER
+    data_dir = os.path.dirname(upload_dir)
+    history_file = os.path.join(data_dir, 'history.jsonl')
+    legacy_history_file = os.path.join(data_dir, 'history.json')
+
+    def load_history():
+        """Stream history.jsonl once at startup into the in-memory deque"""
+        os.makedirs(data_dir, exist_ok=True)
+        if not os.path.exists(history_file) and os.path.exists(legacy_history_file):
+            # One-time migration of the old newest-first history.json array
+            try:
+                with open(legacy_history_file, 'rb') as hf:
+                    legacy = orjson.loads(hf.read())
+                with open(history_file, 'wb') as hf:
+                    for entry in reversed(legacy[:HISTORY_LIMIT]):
+                        hf.write(orjson.dumps(entry) + b'\n')
+            except Exception as e:
+                logger.warning("Failed to migrate history.json: %s", e)
+
+        with HISTORY_LOCK:
+            HISTORY.clear()
+            if not os.path.exists(history_file):
+                return
+            with open(history_file, 'rb') as hf:
+                for line in hf:
+                    try:
+                        HISTORY.appendleft(orjson.loads(line))
+                    except ValueError:
+                        # Skip a torn trailing line from an interrupted write
+                        continue
+            _refresh_history_bytes()
+
+    def record_history(summary):
+        """Record a summary in memory and queue it for history.jsonl"""
+        with HISTORY_LOCK:
+            HISTORY.appendleft(summary)
+            _refresh_history_bytes()
+        try:
+            WRITE_Q.put_nowait(summary)
+        except queue.Full:
+            # The log is best-effort: make room by dropping the oldest entry
+            try:
+                WRITE_Q.get_nowait()
+            except queue.Empty:
+                pass
+            WRITE_Q.put_nowait(summary)
+
+    def history_writer():
+        """Drain WRITE_Q into history.jsonl with one write() per burst"""
+        running = True
+        while running:
+            entry = WRITE_Q.get()
+            if entry is None:
+                break
+            lines = [orjson.dumps(entry)]
+            while len(lines) < WRITE_BATCH:
+                try:
+                    entry = WRITE_Q.get(timeout=0.05)
+                except queue.Empty:
+                    break
+                if entry is None:
+                    running = False
+                    break
+                lines.append(orjson.dumps(entry))
+            try:
+                with open(history_file, 'ab') as hf:
+                    hf.write(b'\n'.join(lines) + b'\n')
+            except Exception as e:
+                logger.warning("Failed to persist history: %s", e)
+
+    history_writer_thread = threading.Thread(
+        target=history_writer, name='history-writer', daemon=True
+    )
 
-    def save_uploaded_file(file):
+    @app.before_serving
+    async def start_history_writer():
+        """Start the background history.jsonl writer"""
+        history_writer_thread.start()
+
+    @app.after_serving
+    async def stop_history_writer():
+        """Flush queued history entries before the server exits"""
+        WRITE_Q.put(None)
+        await asyncio.to_thread(history_writer_thread.join)
+
+    load_history()
+
+    def write_upload(stream, file_path):
+        """Copy an upload stream to disk with as few syscalls as possible"""
+        fd = os.open(file_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o644)
+        try:
+            # Small uploads are still buffered in memory: write the buffer
+            # in one go instead of iterating 16 KB chunks through Python
+            buffer_owner = stream
+            if isinstance(stream, SpooledTemporaryFile) and not stream._rolled:
+                buffer_owner = stream._file
+            if hasattr(buffer_owner, 'getbuffer'):
+                with buffer_owner.getbuffer() as view:
+                    _write_all(fd, view)
+                return
+
+            # Larger uploads were spooled to a real file: let the kernel copy it
+            size = os.fstat(stream.fileno()).st_size
+            offset = 0
+            try:
+                while offset < size:
+                    sent = os.sendfile(fd, stream.fileno(), offset, size - offset)
+                    if sent == 0:
+                        break
+                    offset += sent
+            except (AttributeError, OSError):
+                # No file-to-file sendfile on this platform; copy the rest
+                stream.seek(offset)
+                with os.fdopen(os.dup(fd), 'wb') as dst:
+                    shutil.copyfileobj(stream, dst, 1024 * 1024)
+        finally:
+            os.close(fd)
+
+    def write_image_once(file_path, image_data):
+        """Write image bytes unless a file with this content name already exists"""
+        if os.path.exists(file_path):
+            return
+        # Workers read this file by path, so the content name must only ever
+        # appear complete: write a private temp file, then hard-link it into
+        # place (the link fails atomically if a concurrent upload won)
+        tmp_path = f"{file_path}.{secrets.token_hex(4)}.tmp"
+        fd = os.open(tmp_path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o644)
+        try:
+            try:
+                _write_all(fd, image_data)
+            finally:
+                os.close(fd)
+            os.link(tmp_path, file_path)
+        except FileExistsError:
+            pass
+        finally:
+            os.remove(tmp_path)
+
+    async def store_image_once(file_path, image_data):
+        """Persist image bytes off the event loop"""
+        await asyncio.to_thread(write_image_once, file_path, image_data)
+
+    async def save_uploaded_file(file, file_extension):
         """Save uploaded file and return file path"""
         try:
-            # Generate unique filename
-            filename = secure_filename(file.filename)
-            file_extension = filename.rsplit('.', 1)[1].lower()
-            unique_filename = f"{uuid.uuid4().hex}.{file_extension}"
-            file_path = config.UPLOAD_FOLDER / unique_filename
+            # Generate unique filename. The stored name is a fresh UUID, so
+            # only the (allow-listed) extension is taken from user input.
+            # 64 random bits from one urandom draw is plenty for a file name
+            unique_filename = f"{secrets.token_hex(8)}.{file_extension}"
+            file_path = os.path.join(upload_dir, unique_filename)
             
             # Save file
-            file.save(file_path)
-            logger.info(f"📁 File saved: {file_path}")
+            await asyncio.to_thread(write_upload, file.stream, file_path)
+            logger.info("File saved: %s", file_path)
             return file_path, unique_filename
         except Exception as e:
-            logger.error(f"❌ Failed to save file: {e}")
+            logger.error("Failed to save file: %s", e)
             raise
 
     @app.route('/api/health', methods=['GET'])
-    def health_check():
+    async def health_check():
         """Health check endpoint"""
-        return jsonify({
+        return ojsonify({
             'status': 'healthy',
             'timestamp': datetime.now().isoformat(),
-            'model_loaded': detector is not None,
+            'model_loaded': MODEL_READY,
+            'workers': config.WORKERS,
             'model_type': config.MODEL_TYPE,
             'model_available': MODEL_AVAILABLE,
             'server_version': '1.0.0'
         })
 
     @app.route('/api/analyze', methods=['POST'])
-    def analyze_image():
+    async def analyze_image():
         """Analyze uploaded image for morphing detection"""
         try:
             # Check if file is present in request
-            if 'image' not in request.files:
-                return jsonify({
+            files = await request.files
+            if 'image' not in files:
+                return ojsonify({
                     'error': 'No image file provided',
                     'status': 'error'
                 }), 400
 
-            file = request.files['image']
+            file = files['image']
             
             # Check if file is selected
             if file.filename == '':
-                return jsonify({
+                return ojsonify({
                     'error': 'No file selected',
                     'status': 'error'
                 }), 400
 
-            # Check file extension
-            if not allowed_file(file.filename):
-                return jsonify({
-                    'error': f'File type not allowed. Allowed types: {", ".join(config.ALLOWED_EXTENSIONS)}',
-                    'status': 'error'
-                }), 400
+            # Check file extension (split once; reused for the stored name)
+            file_extension = upload_extension(file.filename)
 
             # Save uploaded file
-            file_path, unique_filename = save_uploaded_file(file)
+            file_path, unique_filename = await save_uploaded_file(file, file_extension)
             
             # Check if model is loaded
-            if detector is None:
-                return jsonify({
+            if not MODEL_READY:
+                return ojsonify({
                     'error': 'Model not initialized',
                     'status': 'error'
                 }), 500
 
-            # Analyze image
-            logger.info(f"🔍 Analyzing image: {unique_filename}")
-            result = detector.detect_morphing(str(file_path))
+            # Analyze image in a worker process, batched with any concurrent
+            # requests. Send the saved path rather than the bytes: pickling a
+            # multi-MB payload through the pool pipe costs more than the
+            # worker re-reading it from the page cache.
+            logger.info("Analyzing image %s", unique_filename)
+            result = await run_detection(file_path)
             
             # Check for errors in detection
             if 'error' in result:
-                return jsonify({
+                return ojsonify({
                     'error': f'Detection failed: {result["error"]}',
                     'status': 'error'
                 }), 500
 
-            # Compute confidence from prob_morphed (probability of MORPHED)
-            prob = float(result.get('prob_morphed', 0.0))
-            # For display, convert to a percentage and scale sensibly
-            confidence_pct = round(prob * 100.0, 1)
-
-            # Interpretation: if predicted_class == 1, model sees MORPHED
-            is_morphed = result.get('predicted_class') == 1
-
-            # Risk assessment based on probability distance from 0.5 and class
-            # Higher probability for MORPHED -> higher risk. For GENUINE, low prob -> low risk.
-            if prob >= 0.9:
-                risk_level = 'CRITICAL'
-            elif prob >= 0.75:
-                risk_level = 'HIGH'
-            elif prob >= 0.5:
-                risk_level = 'MEDIUM'
-            else:
-                risk_level = 'LOW'
-
-            # Prepare response
-            analysis_result = {
-                'status': 'success',
-                'analysis_id': str(uuid.uuid4()),
-                'timestamp': datetime.now().isoformat(),
-                'filename': unique_filename,
-                'result': {
-                    'raw_logit': result.get('raw_logit'),
-                    'predicted_class': result.get('predicted_class'),
-                    'class_name': result.get('class_name'),
-                    'confidence': confidence_pct,
-                    'model': result.get('model')
-                },
-                'interpretation': {
-                    'is_morphed': is_morphed,
-                    'risk_level': risk_level
-                }
-            }
-
-            # Persist summary to history.json next to uploads
+            analysis_result, summary = _build_response(result, unique_filename)
+
+            # Persist summary to history.jsonl next to uploads
             try:
-                history_file = Path(config.UPLOAD_FOLDER).parent / 'history.json'
-                # Ensure parent exists
-                history_file.parent.mkdir(parents=True, exist_ok=True)
-                history = []
-                if history_file.exists():
-                    with open(history_file, 'r', encoding='utf-8') as hf:
-                        try:
-                            history = json.load(hf)
-                        except Exception:
-                            history = []
-
-                # Append compact summary
-                summary = {
-                    'analysis_id': analysis_result['analysis_id'],
-                    'timestamp': analysis_result['timestamp'],
-                    'filename': unique_filename,
-                    'class_name': analysis_result['result']['class_name'],
-                    'confidence': analysis_result['result']['confidence'],
-                    'risk_level': analysis_result['interpretation']['risk_level'],
-                    'regions': result.get('regions', []),
-                    'processing_time_ms': result.get('processing_time_ms', 0),
-                    'thumbnail_url': f"/uploads/{unique_filename}"
-                }
-                history.insert(0, summary)
-                # Keep recent 100 entries
-                history = history[:100]
-                with open(history_file, 'w', encoding='utf-8') as hf:
-                    json.dump(history, hf, indent=2)
+                record_history(summary)
             except Exception as e:
-                logger.warning(f"⚠️  Failed to persist history: {e}")
+                logger.warning("Failed to persist history: %s", e)
 
-            logger.info(f"✅ Analysis completed: {result['class_name']} (logit: {result['raw_logit']:.4f})")
+            logger.info("Analysis completed: %s (logit: %.4f)", summary['class_name'], result['raw_logit'])
             
-            return jsonify(analysis_result)
+            return ojsonify(analysis_result)
 
+        except BadRequest as e:
+            return ojsonify({
+                'error': e.description,
+                'status': 'error'
+            }), 400
         except Exception as e:
-            logger.error(f"❌ Analysis failed: {e}")
-            return jsonify({
+            logger.error("Analysis failed: %s", e)
+            return ojsonify({
                 'error': f'Analysis failed: {str(e)}',
                 'status': 'error'
             }), 500
 
     @app.route('/api/analyze-base64', methods=['POST'])
-    def analyze_image_base64():
+    async def analyze_image_base64():
         """Analyze image from base64 encoded data"""
         try:
-            # Get JSON data
-            data = request.get_json()
-            if not data or 'image' not in data:
-                return jsonify({
+            # Get JSON data; orjson parses multi-MB base64 bodies far faster
+            body = await request.get_data()
+            try:
+                data = orjson.loads(body) if body else None
+            except orjson.JSONDecodeError:
+                data = None
+            if not isinstance(data, dict) or 'image' not in data:
+                return ojsonify({
                     'error': 'No image data provided',
                     'status': 'error'
                 }), 400
 
             # Decode base64 image
             try:
-                image_data = base64.b64decode(data['image'].split(',')[1] if ',' in data['image'] else data['image'])
+                # Skip any data:image/...;base64, prefix with a zero-copy slice
+                payload = data['image'].encode('ascii')
+                image_data = b64decode(memoryview(payload)[payload.find(b',') + 1:], validate=False)
             except Exception as e:
-                return jsonify({
+                return ojsonify({
                     'error': f'Invalid base64 image data: {str(e)}',
                     'status': 'error'
                 }), 400
 
-            # Save temporary file
-            temp_filename = f"temp_{uuid.uuid4().hex}.jpg"
-            temp_path = config.UPLOAD_FOLDER / temp_filename
-            
-            with open(temp_path, 'wb') as f:
-                f.write(image_data)
-
             # Check if model is loaded
-            if detector is None:
-                return jsonify({
+            if not MODEL_READY:
+                return ojsonify({
                     'error': 'Model not initialized',
                     'status': 'error'
                 }), 500
 
-            # Analyze image
-            logger.info(f"🔍 Analyzing base64 image: {temp_filename}")
-            result = detector.detect_morphing(str(temp_path))
-            
-            # Clean up temporary file
-            try:
-                os.remove(temp_path)
-            except:
-                pass
+            # Keep the decoded image under a content-derived name so the
+            # history thumbnail stays valid; identical uploads share one file
+            stored_filename = f"{hashlib.sha1(image_data).hexdigest()[:16]}.jpg"
+            stored_path = os.path.join(upload_dir, stored_filename)
+            await store_image_once(stored_path, image_data)
+
+            # Analyze image; like /api/analyze, send the stored path rather
+            # than pickling the decoded bytes through the pool pipe
+            logger.info("Analyzing base64 image %s", stored_filename)
+            result = await run_detection(stored_path)
 
             # Check for errors in detection
             if 'error' in result:
-                return jsonify({
+                return ojsonify({
                     'error': f'Detection failed: {result["error"]}',
                     'status': 'error'
                 }), 500
 
-            # Compute confidence from prob_morphed
-            prob = float(result.get('prob_morphed', 0.0))
-            confidence_pct = round(prob * 100.0, 1)
-            is_morphed = result.get('predicted_class') == 1
-            if prob >= 0.9:
-                risk_level = 'CRITICAL'
-            elif prob >= 0.75:
-                risk_level = 'HIGH'
-            elif prob >= 0.5:
-                risk_level = 'MEDIUM'
-            else:
-                risk_level = 'LOW'
-
-            analysis_result = {
-                'status': 'success',
-                'analysis_id': str(uuid.uuid4()),
-                'timestamp': datetime.now().isoformat(),
-                'result': {
-                    'raw_logit': result.get('raw_logit'),
-                    'predicted_class': result.get('predicted_class'),
-                    'class_name': result.get('class_name'),
-                    'confidence': confidence_pct,
-                    'model': result.get('model')
-                },
-                'interpretation': {
-                    'is_morphed': is_morphed,
-                    'risk_level': risk_level
-                }
-            }
+            analysis_result, summary = _build_response(result, stored_filename)
 
             # Persist to history
             try:
-                history_file = Path(config.UPLOAD_FOLDER).parent / 'history.json'
-                history_file.parent.mkdir(parents=True, exist_ok=True)
-                history = []
-                if history_file.exists():
-                    with open(history_file, 'r', encoding='utf-8') as hf:
-                        try:
-                            history = json.load(hf)
-                        except Exception:
-                            history = []
-
-                summary = {
-                    'analysis_id': analysis_result['analysis_id'],
-                    'timestamp': analysis_result['timestamp'],
-                    'filename': temp_filename,
-                    'class_name': analysis_result['result']['class_name'],
-                    'confidence': analysis_result['result']['confidence'],
-                    'risk_level': analysis_result['interpretation']['risk_level'],
-                    'regions': result.get('regions', []),
-                    'processing_time_ms': result.get('processing_time_ms', 0),
-                    'thumbnail_url': f"/uploads/{temp_filename}"
-                }
-                history.insert(0, summary)
-                history = history[:100]
-                with open(history_file, 'w', encoding='utf-8') as hf:
-                    json.dump(history, hf, indent=2)
+                record_history(summary)
             except Exception as e:
-                logger.warning(f"⚠️  Failed to persist history: {e}")
+                logger.warning("Failed to persist history: %s", e)
 
-            logger.info(f"✅ Base64 analysis completed: {result['class_name']} (logit: {result['raw_logit']:.4f})")
+            logger.info("Base64 analysis completed: %s (logit: %.4f)", summary['class_name'], result['raw_logit'])
             
-            return jsonify(analysis_result)
+            return ojsonify(analysis_result)
 
         except Exception as e:
-            logger.error(f"❌ Base64 analysis failed: {e}")
-            return jsonify({
+            logger.error("Base64 analysis failed: %s", e)
+            return ojsonify({
                 'error': f'Analysis failed: {str(e)}',
                 'status': 'error'
             }), 500
 
     @app.route('/api/history', methods=['GET'])
-    def get_history():
-        """Get analysis history (mock data for now)"""
-        # Return persisted history if available
-        try:
-            history_file = Path(config.UPLOAD_FOLDER).parent / 'history.json'
-            if history_file.exists():
-                with open(history_file, 'r', encoding='utf-8') as hf:
-                    history = json.load(hf)
-            else:
-                history = []
-            return jsonify({
-                'status': 'success',
-                'history': history
-            })
-        except Exception as e:
-            logger.error(f"❌ Failed to read history: {e}")
-            return jsonify({
-                'status': 'error',
-                'message': 'Failed to read history'
-            }), 500
+    async def get_history():
+        """Get analysis history (newest first)"""
+        # Served from the cached pre-serialized body: no disk I/O and no JSON
+        # encoding per request, whatever the history size
+        return app.response_class(HISTORY_BYTES, mimetype='application/json')
 
     @app.route('/api/calibrate', methods=['POST'])
-    def calibrate_model():
+    async def calibrate_model():
         """Calibrate model with new data (placeholder)"""
-        return jsonify({
+        return ojsonify({
             'status': 'success',
             'message': 'Calibration endpoint - implementation pending',
             'timestamp': datetime.now().isoformat()
         })
 
     @app.route('/uploads/<filename>')
-    def uploaded_file(filename):
+    async def uploaded_file(filename):
         """Serve uploaded files"""
-        return send_from_directory(str(config.UPLOAD_FOLDER), filename)
+        if config.DEBUG:
+            # Dev server has no reverse proxy in front of it
+            return await send_from_directory(upload_dir, filename)
+
+        if filename.startswith('.') or os.path.basename(filename) != filename:
+            return ojsonify({'error': 'File not found', 'status': 'error'}), 404
+
+        # Hand the transfer to Nginx (internal location aliased to the upload
+        # folder) so the worker is released immediately and the kernel sends
+        # the file
+        response = await make_response('')
+        response.headers['X-Accel-Redirect'] = f"{config.UPLOADS_ACCEL_PREFIX}{filename}"
+        # Empty Content-Type lets Nginx pick one from the file extension
+        response.headers['Content-Type'] = ''
+        return response
 
     @app.errorhandler(413)
-    def too_large(e):
+    async def too_large(e):
         """Handle file too large error"""
-        return jsonify({
+        return ojsonify({
             'error': f'File too large. Maximum size is {config.MAX_CONTENT_LENGTH // (1024*1024)}MB.',
             'status': 'error'
         }), 413
 
     @app.errorhandler(500)
-    def internal_error(e):
+    async def internal_error(e):
         """Handle internal server error"""
-        return jsonify({
+        return ojsonify({
             'error': 'Internal server error',
             'status': 'error'
         }), 500
 
     @app.route('/')
-    def index():
+    async def index():
         """Root endpoint"""
-        return jsonify({
+        return ojsonify({
             'message': 'MorphDetect Backend API',
             'version': '1.0.0',
             'endpoints': [
@@ -431,33 +679,30 @@ def create_app(config_name=None):
 
     return app
 
-# Create app instance
-app = create_app()
+# The app instance lives in asgi.py. Spawned inference workers (and Hypercorn
+# workers under `python app.py`) re-import this module as __mp_main__, so it
+# must not build an app, load history or start log listeners at import time.
+
+
+def run_server():
+    """Serve the app with Hypercorn instead of the single-process dev server"""
+    from hypercorn.config import Config as HypercornConfig
+    from hypercorn.run import run
+
+    config = get_config()
+    hypercorn_config = HypercornConfig()
+    hypercorn_config.application_path = 'asgi:app'
+    hypercorn_config.bind = [f"{config.HOST}:{config.PORT}"]
+    # Each server worker starts its own inference pool (see before_serving),
+    # so model parallelism is set by WORKERS, not by SERVER_WORKERS
+    hypercorn_config.workers = config.SERVER_WORKERS
+    # Hypercorn workers are daemonic by default, and a daemonic process may
+    # not start the inference pool's worker processes
+    hypercorn_config.daemon = False
+    # Logging is configured inside the served app, not in this launcher process
+    print("🚀 Starting Hypercorn server...")
+    return run(hypercorn_config)
+
 
 if __name__ == '__main__':
-    # Initialize model before starting server
-    if MODEL_AVAILABLE:
-        try:
-            # Call the app-local initialize_model if present via app.config.
-            init_func = app.config.get('INITIALIZE_MODEL_FUNC')
-            if callable(init_func):
-                init_func()
-            else:
-                # Fallback: try to import and initialize directly
-                from morph_detect_selfmad_official import SelfMADOfficialDetector
-                detector = SelfMADOfficialDetector(
-                    app.config['MODEL_PATH'],
-                    app.config['MODEL_TYPE']
-                )
-                logger.info("✅ Model initialized successfully!")
-        except Exception as e:
-            logger.error(f"❌ Failed to initialize model: {e}")
-            logger.info("⚠️  Server will start in demo mode")
-    
-    logger.info("🚀 Starting Flask server...")
-    app.run(
-        host=app.config['HOST'],
-        port=app.config['PORT'],
-        debug=app.config['DEBUG'],
-        threaded=app.config['THREADED']
-    )
+    sys.exit(run_server())
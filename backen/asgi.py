@@ -0,0 +1,11 @@
+#!/usr/bin/env python3
+"""
+ASGI entry point for MorphDetect Backend
+Run with: hypercorn asgi:app --bind 0.0.0.0:5000 --workers 0
+"""
+
+from app import create_app
+
+# Built here rather than in app.py so processes that re-import app.py
+# (spawned inference workers) never construct a second app
+app = create_app()
@@ -23,8 +23,10 @@ class Config:
     
     # File upload settings
     MAX_CONTENT_LENGTH = 16 * 1024 * 1024  # 16MB
-    UPLOAD_FOLDER = BASE_DIR / 'uploads'
-    ALLOWED_EXTENSIONS = {'png', 'jpg', 'jpeg', 'gif', 'bmp', 'tiff'}
+    UPLOAD_FOLDER = str(BASE_DIR / 'uploads')  # plain str: joined per request
+    ALLOWED_EXTENSIONS = frozenset({'png', 'jpg', 'jpeg', 'gif', 'bmp', 'tiff'})
+    # Internal Nginx location that serves UPLOAD_FOLDER via X-Accel-Redirect
+    UPLOADS_ACCEL_PREFIX = os.environ.get('UPLOADS_ACCEL_PREFIX', '/_uploads/')
     
     # Model settings
     MODEL_PATH = os.environ.get('MODEL_PATH', '')
@@ -33,13 +35,21 @@ class Config:
     # CORS settings
     CORS_ORIGINS = os.environ.get('ALLOWED_ORIGINS', 'http://localhost:5173,http://localhost:5174').split(',')
     
+    # Response compression settings (JSON responses, e.g. /api/history)
+    COMPRESS_ALGORITHM = ['br', 'gzip']
+    COMPRESS_MIMETYPES = ['application/json']
+    COMPRESS_MIN_SIZE = 512
+    COMPRESS_LEVEL = 6
+    COMPRESS_BR_LEVEL = 4
+    
     # Logging settings
     LOG_LEVEL = os.environ.get('LOG_LEVEL', 'INFO')
     LOG_FILE = BASE_DIR / 'logs' / 'morphdetect.log'
     
     # Performance settings
-    THREADED = os.environ.get('THREADED', 'true').lower() == 'true'
-    WORKERS = int(os.environ.get('WORKERS', 4))
+    SERVER_WORKERS = int(os.environ.get('SERVER_WORKERS', 1))  # Hypercorn processes
+    WORKERS = int(os.environ.get('WORKERS', 4))  # inference worker processes
+    INFERENCE_TIMEOUT = int(os.environ.get('INFERENCE_TIMEOUT', 60))  # seconds
 
 class DevelopmentConfig(Config):
     """Development configuration"""
@@ -56,7 +66,7 @@ class TestingConfig(Config):
     """Testing configuration"""
     TESTING = True
     DEBUG = True
-    UPLOAD_FOLDER = BASE_DIR / 'temp' / 'test_uploads'
+    UPLOAD_FOLDER = str(BASE_DIR / 'temp' / 'test_uploads')
 
 # Configuration dictionary
 config = {
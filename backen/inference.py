@@ -0,0 +1,147 @@
+#!/usr/bin/env python3
+"""
+Inference worker pool for MorphDetect Backend
+Each worker process owns its own SelfMAD detector so concurrent requests
+run in parallel instead of queueing behind one interpreter.
+"""
+
+import multiprocessing
+import os
+import queue
+import threading
+import time
+from collections import namedtuple
+from concurrent.futures import Future, ProcessPoolExecutor
+
+# Micro-batching: after the first pending request arrives, wait up to
+# BATCH_WINDOW_S for more and send at most MAX_BATCH as one forward pass
+MAX_BATCH = 16
+BATCH_WINDOW_S = 0.005
+
+# Per-process detector, built once by _init_worker when the worker starts
+_detector = None
+_init_error = None
+
+# Server-side request queue drained by the dispatcher thread
+Req = namedtuple('Req', ['source', 'future'])
+REQ_Q = queue.Queue()
+_dispatcher_thread = None
+
+
+def _init_worker(model_path, model_type, workers):
+    """Pool initializer: construct this process's detector"""
+    global _detector, _init_error
+    try:
+        import torch
+        from morph_detect_selfmad_official import get_detector
+        # Split the host's cores between workers instead of each one
+        # spinning up a full-size intra-op thread pool
+        num_threads = max(1, (os.cpu_count() or 1) // workers)
+        torch.set_num_threads(num_threads)
+        _detector = get_detector(model_path, model_type, num_threads)
+    except Exception as e:
+        _init_error = str(e)
+
+
+def _worker_ready():
+    """Report whether this worker's detector initialized"""
+    return _detector is not None
+
+
+def _run_detect_batch(sources):
+    """Run one batched detection over image paths"""
+    if _detector is None:
+        return [{
+            "image": source,
+            "error": f"Model not initialized: {_init_error}",
+            "raw_logit": None,
+            "predicted_class": None,
+            "class_name": None
+        } for source in sources]
+    return _detector.detect_morphing_batch(sources)
+
+
+def create_pool(model_path, model_type, workers):
+    """Create the worker pool (spawned, so each worker gets a clean CUDA context)"""
+    workers = max(1, workers)
+    return ProcessPoolExecutor(
+        max_workers=workers,
+        mp_context=multiprocessing.get_context('spawn'),
+        initializer=_init_worker,
+        initargs=(model_path, model_type, workers)
+    )
+
+
+def submit_detection(source):
+    """Queue one image for batched detection; returns a concurrent Future"""
+    future = Future()
+    REQ_Q.put(Req(source, future))
+    return future
+
+
+def start_dispatcher(pool):
+    """Start the thread that groups queued requests into pool batches"""
+    global _dispatcher_thread
+    _dispatcher_thread = threading.Thread(
+        target=_dispatch, args=(pool,), name='inference-dispatcher', daemon=True
+    )
+    _dispatcher_thread.start()
+
+
+def stop_dispatcher():
+    """Stop the dispatcher after it has flushed everything already queued"""
+    global _dispatcher_thread
+    if _dispatcher_thread is not None:
+        REQ_Q.put(None)
+        _dispatcher_thread.join()
+        _dispatcher_thread = None
+
+
+def _dispatch(pool):
+    """Dispatcher loop: block for one request, then collect a micro-batch"""
+    running = True
+    while running:
+        first = REQ_Q.get()
+        if first is None:
+            break
+        items = [first]
+        deadline = time.monotonic() + BATCH_WINDOW_S
+        while len(items) < MAX_BATCH:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                item = REQ_Q.get(timeout=remaining)
+            except queue.Empty:
+                break
+            if item is None:
+                running = False
+                break
+            items.append(item)
+
+        # Drop requests whose caller already gave up; the rest can no
+        # longer be cancelled, so _fan_out may resolve them unconditionally
+        items = [item for item in items if item.future.set_running_or_notify_cancel()]
+        if not items:
+            continue
+        try:
+            batch_future = pool.submit(_run_detect_batch, [item.source for item in items])
+        except Exception as e:
+            for item in items:
+                item.future.set_exception(e)
+            continue
+        # Results are fanned out from the pool's callback thread, so the
+        # dispatcher can keep filling batches for the other workers
+        batch_future.add_done_callback(lambda f, items=items: _fan_out(items, f))
+
+
+def _fan_out(items, batch_future):
+    """Resolve each request's future from the batch result list"""
+    try:
+        results = batch_future.result()
+    except Exception as e:
+        for item in items:
+            item.future.set_exception(e)
+        return
+    for item, result in zip(items, results):
+        item.future.set_result(result)
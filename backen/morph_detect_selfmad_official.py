@@ -7,6 +7,15 @@ Based on the official SelfMAD GitHub repository: https://github.com/LeonTodorov/
 
 import os
 import sys
+import functools
+import gc
+import inspect
+import time
+
+# Read when torch first initializes CUDA, so it must be set before the import;
+# growable segments stop varying batch sizes from fragmenting the cache
+os.environ.setdefault('PYTORCH_CUDA_ALLOC_CONF', 'expandable_segments:True,max_split_size_mb:128')
+
 import torch
 import torch.nn as nn
 import torch.nn.functional as F
@@ -19,62 +28,124 @@ import struct
 from efficientnet_pytorch import EfficientNet
 from torchvision.models import swin_v2_b, resnet152
 from torchvision.models import Swin_V2_B_Weights, ResNet152_Weights
+from torch.fx.experimental.optimization import fuse as fuse_conv_bn
+from torch.nn.utils.fusion import fuse_conv_bn_eval
 import timm
+from safetensors.torch import load_file, save_file
 
-# Simplified SAM optimizer (since utils.sam might not be available)
-class SAM:
-    def __init__(self, parameters, optimizer_class, **kwargs):
-        self.parameters = parameters
-        self.optimizer_class = optimizer_class
-        self.kwargs = kwargs
-        self.optimizer = None
-    
-    def zero_grad(self):
-        if self.optimizer:
-            self.optimizer.zero_grad()
-    
-    def first_step(self, zero_grad=False):
-        if zero_grad:
-            self.zero_grad()
-        if not self.optimizer:
-            self.optimizer = self.optimizer_class(self.parameters, **self.kwargs)
-    
-    def second_step(self, zero_grad=False):
-        if zero_grad:
-            self.zero_grad()
-        if self.optimizer:
-            self.optimizer.step()
+# ONNX Runtime is optional; without it inference stays on eager PyTorch
+try:
+    import onnxruntime as ort
+except ImportError:
+    ort = None
 
 # -------- Configuration --------
 DEVICE = torch.device("cuda" if torch.cuda.is_available() else "cpu")
+
+# Inputs are always (B, 3, image_size, image_size), so cuDNN's autotuned
+# conv algorithms stay valid; TF32 lets Ampere+ tensor cores run FP32 matmuls
+torch.backends.cudnn.benchmark = True
+torch.backends.cuda.matmul.allow_tf32 = True
+torch.backends.cudnn.allow_tf32 = True
+torch.set_float32_matmul_precision('high')
+
+# Run the forward pass in FP16 on CUDA; weights stay FP32 and logits are upcast
+USE_AUTOCAST = DEVICE.type == 'cuda'
+
+# MORPH_INT8=1 lets CPU-only hosts try INT8 weights; they are kept only if faster.
+# Dynamically quantized convs have no fast CPU kernel, so this is opt-in
+USE_INT8 = DEVICE.type == 'cpu' and os.environ.get('MORPH_INT8', '0') != '0'
+
+# Largest forward-pass batch (matches the server's MAX_BATCH micro-batches)
+BATCH_SIZE = 16
 # ------------------------------
 
-# Official SelfMAD model architecture (exact copy from their utils/model.py)
+def _efficientnet(name, pretrained):
+    if pretrained:
+        return EfficientNet.from_pretrained(name,advprop=True,num_classes=2)
+    return EfficientNet.from_name(name,num_classes=2)
+
+def _swin(pretrained):
+    net=swin_v2_b(weights=Swin_V2_B_Weights.IMAGENET1K_V1 if pretrained else None)
+    net.head = nn.Linear(in_features=net.head.in_features, out_features=2, bias=True)
+    return net
+
+def _resnet(pretrained):
+    net = resnet152(weights=ResNet152_Weights.IMAGENET1K_V2 if pretrained else None)
+    # torchvision's ResNet classifies through .fc (2048 features); it has no .head
+    net.fc = nn.Linear(in_features=net.fc.in_features, out_features=2, bias=True)
+    return net
+
+def _hrnet(name, pretrained):
+    return timm.create_model(name, pretrained=pretrained, num_classes=2)
+
+# Backbone builders keyed by model type; each takes the pretrained flag.
+# pretrained=True downloads ImageNet weights, which is only worth it when
+# no checkpoint will overwrite every parameter anyway
+_BUILDERS = {
+    "efficientnet-b0": functools.partial(_efficientnet, "efficientnet-b0"),
+    "efficientnet-b4": functools.partial(_efficientnet, "efficientnet-b4"),
+    "swin": _swin,
+    "resnet": _resnet,
+    "hrnet_w18": functools.partial(_hrnet, "hrnet_w18"),
+    "hrnet_w32": functools.partial(_hrnet, "hrnet_w32"),
+    "hrnet_w44": functools.partial(_hrnet, "hrnet_w44"),
+    "hrnet_w64": functools.partial(_hrnet, "hrnet_w64"),
+}
+
+def _make_backbone(model, pretrained):
+    """Build the requested backbone; get_detector keeps one detector per process"""
+    try:
+        builder = _BUILDERS[model]
+    except KeyError:
+        raise ValueError(f"Unknown model type '{model}'. Available: {', '.join(_BUILDERS)}") from None
+    return builder(pretrained)
+
+# (conv, bn) attribute pairs that efficientnet_pytorch applies back to back
+# in EfficientNet.extract_features and MBConvBlock.forward
+_EFFICIENTNET_CONV_BN = (
+    ("_conv_stem", "_bn0"),
+    ("_conv_head", "_bn1"),
+    ("_expand_conv", "_bn0"),
+    ("_depthwise_conv", "_bn1"),
+    ("_project_conv", "_bn2"),
+)
+
+def _fold_efficientnet_bn(net):
+    """Fold EfficientNet's conv/bn pairs in place, leaving Identity in each bn slot"""
+    folded = 0
+    for module in list(net.modules()):
+        for conv_name, bn_name in _EFFICIENTNET_CONV_BN:
+            conv = getattr(module, conv_name, None)
+            bn = getattr(module, bn_name, None)
+            if isinstance(conv, nn.Conv2d) and isinstance(bn, nn.BatchNorm2d):
+                # fuse_conv_bn_eval deep-copies conv, so the static-padding subclass survives
+                setattr(module, conv_name, fuse_conv_bn_eval(conv, bn))
+                setattr(module, bn_name, nn.Identity())
+                folded += 1
+    return folded
+
+def _count_batchnorm(net):
+    return sum(isinstance(m, nn.BatchNorm2d) for m in net.modules())
+
+# Input resolution per model type (from SelfMAD code)
+_IMG_SIZES = {
+    "efficientnet-b0": 224,
+    "efficientnet-b4": 380,
+    "swin": 224,
+    "resnet": 224,
+    "hrnet_w18": 384,
+    "hrnet_w32": 384,
+    "hrnet_w44": 384,
+    "hrnet_w64": 384,
+}
+
+# Official SelfMAD model architecture (their utils/model.py without the training-only loss/optimizer)
 class Detector(nn.Module):
     
-    def __init__(self, model="hrnet_w18_multi", lr=5e-4):
+    def __init__(self, model="hrnet_w18", pretrained=False):
         super(Detector, self).__init__()
-        if model == "efficientnet-b0":
-            self.net=EfficientNet.from_pretrained("efficientnet-b0",advprop=True,num_classes=2)
-        elif model == "efficientnet-b4":
-            self.net=EfficientNet.from_pretrained("efficientnet-b4",advprop=True,num_classes=2)
-        elif model == "swin":
-            self.net=swin_v2_b(weights=Swin_V2_B_Weights.IMAGENET1K_V1)
-            self.net.head = nn.Linear(in_features=1024, out_features=2, bias=True)
-        elif model == "resnet":
-            self.net = resnet152(weights=ResNet152_Weights.IMAGENET1K_V2)
-            self.net.head = nn.Linear(in_features=1024, out_features=2, bias=True)
-        elif model == "hrnet_w18":
-            self.net = timm.create_model('hrnet_w18', pretrained=True, num_classes=2)
-        elif model == "hrnet_w32":
-            self.net = timm.create_model('hrnet_w32', pretrained=True, num_classes=2)
-        elif model == "hrnet_w44":
-            self.net = timm.create_model('hrnet_w44', pretrained=True, num_classes=2)
-        elif model == "hrnet_w64":
-            self.net = timm.create_model('hrnet_w64', pretrained=True, num_classes=2)
-            
-        self.cel=nn.CrossEntropyLoss()
-        self.optimizer=SAM(self.parameters(),torch.optim.SGD,lr=lr, momentum=0.9)
+        self.net = _make_backbone(model, pretrained)
 
     def forward(self,x):
         x=self.net(x)
@@ -83,55 +154,295 @@ class Detector(nn.Module):
 class SelfMADOfficialDetector:
     """Official SelfMAD detector with proper checkpoint loading"""
     
-    def __init__(self, model_path=None, model_type='efficientnet-b0'):
+    def __init__(self, model_path=None, model_type='efficientnet-b0', num_threads=None):
         self.model_type = model_type
-        self.model = Detector(model=model_type)
+        # CPU threads ONNX Runtime may use per op (None: its own default)
+        self.num_threads = num_threads
+        has_checkpoint = bool(model_path and os.path.exists(model_path))
+        self.model = Detector(model=model_type, pretrained=not has_checkpoint)
         
-        if model_path and os.path.exists(model_path):
+        if has_checkpoint:
             self.load_model(model_path)
+            # The loaders' checkpoint dicts are garbage now; reclaim their
+            # host memory before the rest of startup allocates more
+            gc.collect()
         
         self.model.train(mode=False)
+        if "swin" not in model_type:
+            self._fold_batchnorm()
         self.model.to(DEVICE)
         
+        # NHWC lets cuDNN pick its faster conv kernels; Swin has no convs to gain from it
+        self.channels_last = "swin" not in model_type
+        if self.channels_last:
+            self.model.to(memory_format=torch.channels_last)
+        
         # Image size based on model type (from SelfMAD code)
-        if "hrnet" in model_type:
-            self.image_size = 384
-        elif "efficientnet" in model_type:
-         if "b0" in model_type:
-            self.image_size = 224
-         elif "b4" in model_type:
-            self.image_size = 380
-         else:
-            self.image_size = 224
-        elif "swin" in model_type:
-            self.image_size = 224  # Swin Transformer typically uses 224x224
-        elif "resnet" in model_type:
-            self.image_size = 224  # ResNet typically uses 224x224
-        else:
-            self.image_size = 380
+        self.image_size = _IMG_SIZES.get(model_type, 380)
+        
+        if DEVICE.type == 'cuda':
+            # Pinned staging buffer for one resized batch and a side stream for H2D copies
+            self._pin = torch.empty((BATCH_SIZE, self.image_size, self.image_size, 3),
+                                    dtype=torch.uint8, pin_memory=True)
+            self._h2d_stream = torch.cuda.Stream()
+            self._h2d_done = torch.cuda.Event()
+        
+        # Serve through ONNX Runtime when it is installed, exporting the
+        # checkpoint once to an .onnx file cached beside it
+        self.ort_session = None
+        if ort is not None and model_path and os.path.exists(model_path):
+            self.ort_session = self._load_onnx_session(model_path)
+        if self.ort_session is not None:
+            # ONNX Runtime holds its own copy of the weights; drop the torch one
+            self.model = None
+            gc.collect()
+            if DEVICE.type == 'cuda':
+                torch.cuda.empty_cache()
+        
+        if self.ort_session is None and USE_INT8 and "swin" in model_type:
+            # Eager dynamic quantization only covers nn.Linear; the convnets have
+            # just their classifier head there, so only Swin gains from it
+            self.model = torch.ao.quantization.quantize_dynamic(
+                self.model,
+                {nn.Linear: torch.ao.quantization.per_channel_dynamic_qconfig},
+                dtype=torch.qint8
+            )
+        
+        # The eager fallback is compiled with TorchInductor instead
+        if self.ort_session is None and hasattr(torch, 'compile'):
+            self._compile_model()
         
         print(f"✅ Initialized SelfMAD {model_type.upper()} detector")
     
+    def _fold_batchnorm(self):
+        """Fold eval-mode BatchNorm layers into the convolutions before them"""
+        net = self.model.net
+        if isinstance(net, EfficientNet):
+            # Its convs are Conv2dStaticSamePadding, which fx traces through into
+            # F.conv2d, so the module-pattern fuser would never match them
+            folded = _fold_efficientnet_bn(net)
+        else:
+            before = _count_batchnorm(net)
+            try:
+                fused = fuse_conv_bn(net, inplace=True)
+            except Exception as e:
+                # Tracing fails before anything is modified, so the unfused net is still intact
+                print(f"⚠️  BatchNorm folding skipped: {e}")
+                return
+            folded = before - _count_batchnorm(fused)
+            if folded:
+                self.model.net = fused
+        if folded:
+            print(f"🔧 Folded {folded} BatchNorm layers into convolutions")
+        else:
+            print("⚠️  BatchNorm folding found no Conv+BatchNorm pairs")
+    
+    def _compile_model(self):
+        """Compile the model and run one warm-up forward so the first request skips compilation"""
+        # CUDA graphs ('reduce-overhead') only exist on GPU
+        mode = 'reduce-overhead' if DEVICE.type == 'cuda' else 'default'
+        eager = self.model
+        try:
+            self.model = torch.compile(eager, mode=mode, fullgraph=False)
+            # Warm-up inputs must match what preprocess_batch produces, or the
+            # first real batch fails Dynamo's guards and recompiles mid-request:
+            # same memory format, and a dynamic batch dimension so micro-batches
+            # share graphs. Dynamo always specializes size 1, and the dynamic
+            # graph's guards can stop short of BATCH_SIZE, so both also get a
+            # warm-up pass of their own.
+            # The dummies are built outside inference_mode, like real batches:
+            # Dynamo also guards on whether its input is an inference tensor.
+            memory_format = torch.channels_last if self.channels_last else torch.contiguous_format
+            for batch in (2, BATCH_SIZE, 1):
+                dummy = torch.zeros(batch, 3, self.image_size, self.image_size, device=DEVICE)
+                dummy = dummy.contiguous(memory_format=memory_format)
+                if batch > 1:
+                    torch._dynamo.mark_dynamic(dummy, 0)
+                with torch.inference_mode():
+                    with torch.autocast(DEVICE.type, dtype=torch.float16, enabled=USE_AUTOCAST):
+                        self.model(dummy)
+        except Exception as e:
+            # Compilation errors surface on the first call, so fall back here
+            print(f"⚠️  torch.compile failed, using eager PyTorch: {e}")
+            self.model = eager
+    
+    def _load_onnx_session(self, model_path):
+        """Open the cached ONNX graph for model_path, exporting it first if missing or stale"""
+        onnx_path = os.path.splitext(model_path.rstrip(os.sep))[0] + '.onnx'
+        if DEVICE.type == 'cuda':
+            if 'CUDAExecutionProvider' not in ort.get_available_providers():
+                print("⚠️  onnxruntime has no CUDA provider, using PyTorch")
+                return None
+            providers = ['CUDAExecutionProvider', 'CPUExecutionProvider']
+        else:
+            providers = ['CPUExecutionProvider']
+        
+        try:
+            if not os.path.exists(onnx_path) or os.path.getmtime(onnx_path) < os.path.getmtime(model_path):
+                self._export_onnx(onnx_path)
+            session = ort.InferenceSession(onnx_path, self._session_options(), providers=providers)
+        except Exception as e:
+            print(f"⚠️  ONNX Runtime setup failed, using PyTorch: {e}")
+            return None
+        
+        if USE_INT8:
+            # A failed INT8 build only costs the quantization, not the FP32 session
+            int8_session = self._load_int8_session(onnx_path, providers)
+            if int8_session is not None:
+                int8_time, fp32_time = self._time_session(int8_session), self._time_session(session)
+                print(f"⏱️  ONNX forward pass: INT8 {int8_time * 1000:.1f}ms, FP32 {fp32_time * 1000:.1f}ms")
+                if int8_time < fp32_time:
+                    print("⚡ Serving through ONNX Runtime (INT8)")
+                    return int8_session
+                print("⚠️  INT8 graph is slower on this host, keeping FP32")
+        print(f"⚡ Serving through ONNX Runtime: {onnx_path}")
+        return session
+    
+    def _session_options(self):
+        """ORT session options capped to this detector's CPU thread budget"""
+        options = ort.SessionOptions()
+        if self.num_threads:
+            options.intra_op_num_threads = self.num_threads
+        return options
+    
+    def _load_int8_session(self, onnx_path, providers):
+        """Quantize onnx_path and open it, or return None if that or a test run fails"""
+        try:
+            int8_path = self._quantize_onnx(onnx_path)
+            session = ort.InferenceSession(int8_path, self._session_options(), providers=providers)
+            # Only switch over once the quantized graph has actually run
+            dummy = np.zeros((1, 3, self.image_size, self.image_size), dtype=np.float32)
+            session.run(['output'], {'input': dummy})
+        except Exception as e:
+            print(f"⚠️  INT8 quantization failed, serving FP32 ONNX: {e}")
+            return None
+        return session
+    
+    def _time_session(self, session, runs=5):
+        """Best-of-runs latency of one single-image forward pass through session"""
+        dummy = np.zeros((1, 3, self.image_size, self.image_size), dtype=np.float32)
+        session.run(['output'], {'input': dummy})
+        best = float('inf')
+        for _ in range(runs):
+            start = time.perf_counter()
+            session.run(['output'], {'input': dummy})
+            best = min(best, time.perf_counter() - start)
+        return best
+    
+    def _export_onnx(self, onnx_path):
+        """Export the loaded model to ONNX with a dynamic batch axis"""
+        print(f"📤 Exporting ONNX graph to: {onnx_path}")
+        if hasattr(self.model.net, 'set_swish'):
+            # EfficientNet's memory-efficient swish is a custom autograd op the exporter cannot trace
+            self.model.net.set_swish(memory_efficient=False)
+        dummy = torch.randn(1, 3, self.image_size, self.image_size, device=DEVICE)
+        # Per-process temp name, so concurrently starting workers never clash
+        tmp_path = f"{onnx_path}.{os.getpid()}.tmp"
+        # Newer torch defaults to the dynamo exporter, which needs onnxscript;
+        # stay on the TorchScript exporter these dynamic_axes are written for
+        extra = {'dynamo': False} if 'dynamo' in inspect.signature(torch.onnx.export).parameters else {}
+        torch.onnx.export(
+            self.model, dummy, tmp_path,
+            opset_version=17,
+            input_names=['input'],
+            output_names=['output'],
+            dynamic_axes={'input': {0: 'B'}, 'output': {0: 'B'}},
+            do_constant_folding=True,
+            **extra
+        )
+        os.replace(tmp_path, onnx_path)
+    
+    def _quantize_onnx(self, onnx_path):
+        """Return the INT8 copy of onnx_path, quantizing it first if missing or stale"""
+        from onnxruntime.quantization import QuantType, quant_pre_process, quantize_dynamic
+        int8_path = os.path.splitext(onnx_path)[0] + '.int8.onnx'
+        if not os.path.exists(int8_path) or os.path.getmtime(int8_path) < os.path.getmtime(onnx_path):
+            print(f"🗜️  Quantizing ONNX graph to INT8: {int8_path}")
+            pre_path = f"{int8_path}.{os.getpid()}.pre.tmp"
+            tmp_path = f"{int8_path}.{os.getpid()}.tmp"
+            try:
+                # Shape inference + graph cleanup first, as ORT recommends before quantizing
+                quant_pre_process(onnx_path, pre_path)
+                # Only Conv and MatMul: per-channel quantization of the 2-way
+                # classifier Gemm fails ORT's shape inference, and that layer
+                # is too small to be worth quantizing anyway
+                quantize_dynamic(
+                    pre_path, tmp_path,
+                    weight_type=QuantType.QInt8,
+                    per_channel=True,
+                    op_types_to_quantize=['Conv', 'MatMul']
+                )
+                os.replace(tmp_path, int8_path)
+            finally:
+                for path in (pre_path, tmp_path):
+                    if os.path.exists(path):
+                        os.remove(path)
+        return int8_path
+    
     def load_model(self, model_path):
-        """Load SelfMAD checkpoint using official method"""
+        """Load SelfMAD checkpoint, preferring its memory-mapped safetensors copy"""
         print(f"📥 Loading SelfMAD model from: {model_path}")
         
+        if model_path.endswith('.safetensors'):
+            return self._load_safetensors(model_path)
+        
+        st_path = os.path.splitext(model_path.rstrip(os.sep))[0] + '.safetensors'
+        if os.path.exists(st_path) and os.path.getmtime(st_path) >= os.path.getmtime(model_path):
+            return self._load_safetensors(st_path)
+        
+        # One-time migration: unpickle the legacy checkpoint, then save it as safetensors
+        self._load_legacy_checkpoint(model_path)
+        self._save_safetensors(st_path)
+    
+    def _load_safetensors(self, st_path):
+        """Load a safetensors state_dict (mmapped, no unpickling)"""
+        # The model is still on the CPU here; it moves to DEVICE after loading
+        self._load_state_dict(load_file(st_path, device='cpu'))
+        print(f"✅ Successfully loaded safetensors checkpoint: {st_path}")
+    
+    def _load_state_dict(self, state_dict):
+        """load_state_dict, adapting ResNet checkpoints saved with the old unused head"""
+        if self.model_type == "resnet" and "net.head.weight" in state_dict:
+            # Those checkpoints were trained through the 1000-way ImageNet fc with
+            # labels 0/1, so its first two rows are the two class logits
+            state_dict = {k: v for k, v in state_dict.items() if not k.startswith("net.head.")}
+            state_dict["net.fc.weight"] = state_dict["net.fc.weight"][:2]
+            state_dict["net.fc.bias"] = state_dict["net.fc.bias"][:2]
+        self.model.load_state_dict(state_dict, strict=True)
+    
+    def _save_safetensors(self, st_path):
+        """Write the loaded weights to st_path so later starts skip the pickle loaders"""
+        state_dict = {k: v.contiguous() for k, v in self.model.state_dict().items()}
+        # Per-process temp name, so concurrently starting workers never clash
+        tmp_path = f"{st_path}.{os.getpid()}.tmp"
+        try:
+            save_file(state_dict, tmp_path)
+            os.replace(tmp_path, st_path)
+            print(f"💾 Saved safetensors checkpoint: {st_path}")
+        except Exception as e:
+            print(f"⚠️  Could not save safetensors checkpoint: {e}")
+    
+    def _load_legacy_checkpoint(self, model_path):
+        """Load SelfMAD checkpoint using official method"""
         # Check if it's a .tar file (official SelfMAD format)
         if model_path.endswith('.tar'):
-            return self._load_from_tar_file(model_path)
+            # Nothing pretrained sits underneath a checkpoint, so failing to load must not pass silently
+            if not self._load_from_tar_file(model_path):
+                raise RuntimeError(f"❌ Failed to load SelfMAD model from {model_path}")
+            return
         
         # Try to load the checkpoint using the official SelfMAD method
         try:
             # Load checkpoint with proper PyTorch settings
-            checkpoint = torch.load(model_path, map_location=DEVICE, weights_only=False)
+            checkpoint = torch.load(model_path, map_location='cpu', weights_only=False)
             
             if isinstance(checkpoint, dict):
                 if 'model' in checkpoint:
-                    self.model.load_state_dict(checkpoint['model'])
+                    self._load_state_dict(checkpoint['model'])
                     print("✅ Successfully loaded model state_dict from 'model' key")
                     return
                 elif 'state_dict' in checkpoint:
-                    self.model.load_state_dict(checkpoint['state_dict'])
+                    self._load_state_dict(checkpoint['state_dict'])
                     print("✅ Successfully loaded model state_dict from 'state_dict' key")
                     return
                 else:
@@ -139,7 +450,7 @@ class SelfMADOfficialDetector:
                     raise ValueError("No 'model' or 'state_dict' key found in checkpoint")
             else:
                 # Try to load directly as state dict
-                self.model.load_state_dict(checkpoint)
+                self._load_state_dict(checkpoint)
                 print("✅ Successfully loaded checkpoint directly as state_dict")
                 return
                 
@@ -159,17 +470,17 @@ class SelfMADOfficialDetector:
             print(f"📦 Loading from .tar file: {tar_path}")
             
             # Load checkpoint from .tar file
-            checkpoint = torch.load(tar_path, map_location=DEVICE, weights_only=False)
+            checkpoint = torch.load(tar_path, map_location='cpu', weights_only=False)
             
             if isinstance(checkpoint, dict):
                 print(f"📋 Checkpoint keys: {list(checkpoint.keys())}")
                 
                 if 'model' in checkpoint:
-                    self.model.load_state_dict(checkpoint['model'])
+                    self._load_state_dict(checkpoint['model'])
                     print("✅ Successfully loaded model state_dict from .tar 'model' key")
                     return True
                 elif 'state_dict' in checkpoint:
-                    self.model.load_state_dict(checkpoint['state_dict'])
+                    self._load_state_dict(checkpoint['state_dict'])
                     print("✅ Successfully loaded model state_dict from .tar 'state_dict' key")
                     return True
                 else:
@@ -244,15 +555,15 @@ class SelfMADOfficialDetector:
                 
                 # Try different key combinations
                 if 'model' in data:
-                    self.model.load_state_dict(data['model'])
+                    self._load_state_dict(data['model'])
                     print("✅ Successfully loaded model state_dict from pickle 'model' key")
                     return True
                 elif 'state_dict' in data:
-                    self.model.load_state_dict(data['state_dict'])
+                    self._load_state_dict(data['state_dict'])
                     print("✅ Successfully loaded model state_dict from pickle 'state_dict' key")
                     return True
                 elif 'weights' in data:
-                    self.model.load_state_dict(data['weights'])
+                    self._load_state_dict(data['weights'])
                     print("✅ Successfully loaded model state_dict from pickle 'weights' key")
                     return True
                 else:
@@ -266,73 +577,148 @@ class SelfMADOfficialDetector:
             print(f"❌ Pickle loading failed: {e}")
             return False
     
-    def preprocess_image(self, image_path):
-        """Preprocess image using SelfMAD method"""
-        try:
-            # Load image
-            img = np.array(Image.open(image_path))
-            
-            # Resize to model-specific size
-            img = cv2.resize(img, (self.image_size, self.image_size))
-            
-            # Convert to tensor format
-            img = img.transpose((2, 0, 1))  # HWC to CHW
-            img = img.astype('float32') / 255.0  # Normalize to [0, 1]
-            img = img[np.newaxis, ...]  # Add batch dimension
-            
-            # Convert to torch tensor
-            img_tensor = torch.from_numpy(img).to(DEVICE, non_blocking=True).float()
-            
-            return img_tensor
-            
-        except Exception as e:
-            raise ValueError(f"Failed to preprocess image: {e}")
+    def load_image(self, image):
+        """Decode an image file into a uint8 (S, S, 3) RGB tensor on the CPU"""
+        # Resizing the uint8 image first keeps full-resolution pixels out of float math
+        # and converts colour on S*S pixels instead of the whole photo
+        size = (self.image_size, self.image_size)
+        img = cv2.imdecode(np.fromfile(image, dtype=np.uint8), cv2.IMREAD_COLOR)
+        if img is not None:
+            img = cv2.resize(img, size, interpolation=cv2.INTER_LINEAR)
+            return torch.from_numpy(cv2.cvtColor(img, cv2.COLOR_BGR2RGB))
+        # OpenCV cannot decode every format (e.g. GIF); PIL handles those
+        img = np.array(Image.open(image).convert('RGB'))
+        return torch.from_numpy(cv2.resize(img, size, interpolation=cv2.INTER_LINEAR))
+    
+    def preprocess_batch(self, images):
+        """Normalize decoded uint8 images into one (B, 3, S, S) batch on DEVICE"""
+        if DEVICE.type == 'cuda':
+            batch = self._upload(images)
+        else:
+            batch = torch.stack(images)
+        # NHWC -> NCHW as a stride change is already channels_last; float() keeps that layout
+        batch = batch.permute(0, 3, 1, 2).float().div_(255.)
+        if not self.channels_last:
+            batch = batch.contiguous()
+        return batch
+    
+    def _upload(self, images):
+        """Stack resized images in the pinned buffer and send them to DEVICE in one H2D copy"""
+        # The previous batch's copy must have finished before its staging bytes are overwritten
+        self._h2d_done.synchronize()
+        if len(images) <= len(self._pin):
+            pinned = torch.stack(images, out=self._pin[:len(images)])
+        else:
+            # Callers passing batch_size > BATCH_SIZE get a one-off pinned buffer
+            pinned = torch.stack(images).pin_memory()
+        
+        with torch.cuda.stream(self._h2d_stream):
+            staged = pinned.to(DEVICE, non_blocking=True)
+            self._h2d_done.record()
+        current = torch.cuda.current_stream()
+        current.wait_stream(self._h2d_stream)
+        # staged was allocated on the side stream but is read on the current one
+        staged.record_stream(current)
+        return staged
     
     def detect_morphing(self, image_path):
         """Detect morphing using SelfMAD model - raw logits only"""
+        return self.detect_morphing_batch([image_path])[0]
+    
+    def detect_morphing_batch(self, images, batch_size=BATCH_SIZE):
+        """Detect morphing on several image paths, batch_size per forward pass"""
+        results = [None] * len(images)
+        decoded, names, slots = [], [], []
+        for i, image in enumerate(images):
+            try:
+                decoded.append(self.load_image(image))
+            except Exception as e:
+                # A bad image only fails its own slot, not the whole batch
+                results[i] = self._error_result(image, f"Failed to preprocess image: {e}")
+                continue
+            names.append(image)
+            slots.append(i)
+        
+        for start in range(0, len(decoded), batch_size):
+            chunk_names = names[start:start + batch_size]
+            try:
+                batch = self.preprocess_batch(decoded[start:start + batch_size])
+                batch_results = self._classify(batch, chunk_names)
+            except Exception as e:
+                batch_results = [self._error_result(name, e) for name in chunk_names]
+            for i, result in zip(slots[start:start + batch_size], batch_results):
+                results[i] = result
+        return results
+    
+    def _error_result(self, image, error):
+        return {
+            "image": image,
+            "error": str(error),
+            "raw_logit": None,
+            "predicted_class": None,
+            "class_name": None
+        }
+    
+    def _run_onnx(self, img_tensor):
+        """Run the ORT session with its input and output bound straight to tensors on DEVICE"""
+        x = img_tensor.contiguous()
+        logits = torch.empty((x.shape[0], 2), dtype=torch.float32, device=DEVICE)
+        device_id = DEVICE.index or 0
+        binding = self.ort_session.io_binding()
+        binding.bind_input('input', DEVICE.type, device_id, np.float32, tuple(x.shape), x.data_ptr())
+        binding.bind_output('output', DEVICE.type, device_id, np.float32, tuple(logits.shape), logits.data_ptr())
+        if DEVICE.type == 'cuda':
+            # ORT runs on its own stream; preprocessing must have finished writing x
+            torch.cuda.current_stream().synchronize()
+        self.ort_session.run_with_iobinding(binding)
+        return logits
+    
+    def _classify(self, img_tensor, image_paths):
+        """Run the model on a preprocessed (B, C, H, W) batch and build one result dict per row"""
         try:
-            # Preprocess image
-            img_tensor = self.preprocess_image(image_path)
-            
             # Inference - get raw logits without softmax
-            with torch.no_grad():
-                output = self.model(img_tensor)
-                # Convert to CPU tensor and numpy
-                logits = output.cpu().data.numpy()[0]
-                # Ensure logits is a 1-D array length 2
-                if hasattr(logits, '__len__') and len(logits) >= 2:
-                    raw_logit = float(logits[1])
+            with torch.inference_mode():
+                if self.ort_session is not None:
+                    logits = self._run_onnx(img_tensor)
                 else:
-                    # Fallback if shape unexpected
-                    raw_logit = float(logits)
-                # Get predicted class (0 or 1)
-                predicted_class = int(np.argmax(logits))
-                # Compute softmax probability for class 1 (morphed)
-                try:
-                    probs = F.softmax(torch.from_numpy(logits), dim=0).numpy()
-                    prob_morphed = float(probs[1]) if len(probs) > 1 else float(probs[0])
-                except Exception:
-                    # Fallback to sigmoid on raw_logit
-                    prob_morphed = float(1.0 / (1.0 + np.exp(-raw_logit)))
+                    with torch.autocast(DEVICE.type, dtype=torch.float16, enabled=USE_AUTOCAST):
+                        logits = self.model(img_tensor)
+                logits = logits.float()
+                # With two classes softmax(logits)[:, 1] == sigmoid(l1 - l0).
+                # Everything stays on DEVICE; the (B, 3) stack of per-row
+                # values is the only device-to-host copy (and sync) per batch
+                rows = torch.stack((
+                    logits[:, 1],
+                    torch.sigmoid(logits[:, 1] - logits[:, 0]),
+                    logits.argmax(dim=1).float()
+                ), dim=1).tolist()
             
-            # Return raw output without softmax
-            return {
-                "image": image_path,
-                "raw_logit": float(raw_logit),
-                "predicted_class": int(predicted_class),
-                "prob_morphed": float(prob_morphed),
-                "class_name": "MORPHED" if predicted_class == 1 else "GENUINE",
-                "model": f"SelfMAD {self.model_type.upper()}"
-            }
+            results = []
+            for image_path, (raw_logit, prob, predicted) in zip(image_paths, rows):
+                predicted_class = int(predicted)
+                # Return raw output without softmax
+                results.append({
+                    "image": image_path,
+                    "raw_logit": float(raw_logit),
+                    "predicted_class": int(predicted_class),
+                    "prob_morphed": float(prob),
+                    "class_name": "MORPHED" if predicted_class == 1 else "GENUINE",
+                    "model": f"SelfMAD {self.model_type.upper()}"
+                })
+            return results
             
         except Exception as e:
-            return {
-                "image": image_path,
-                "error": str(e),
-                "raw_logit": None,
-                "predicted_class": None,
-                "class_name": None
-            }
+            return [self._error_result(image_path, e) for image_path in image_paths]
+
+# Detectors already built in this process, keyed by (model_path, model_type)
+_detectors = {}
+
+def get_detector(model_path=None, model_type='efficientnet-b0', num_threads=None):
+    """Return this process's shared detector, building it on first use"""
+    key = (model_path, model_type)
+    if key not in _detectors:
+        _detectors[key] = SelfMADOfficialDetector(model_path, model_type, num_threads)
+    return _detectors[key]
 
 def main():
     parser = argparse.ArgumentParser(description='Official SelfMAD Morph Detection')
@@ -371,7 +757,7 @@ def main():
     
     # Initialize detector
     print("🔧 Initializing official SelfMAD detector...")
-    detector = SelfMADOfficialDetector(args.model_path, args.model_type)
+    detector = get_detector(args.model_path, args.model_type)
     
     if args.test_all:
         # Test both images
@@ -379,10 +765,14 @@ def main():
         print("🧪 Testing all images with official SelfMAD...")
         print("=" * 60)
         
+        # One batched forward pass over every image that exists
+        found = [img for img in images if os.path.exists(img)]
+        results = dict(zip(found, detector.detect_morphing_batch(found)))
+        
         for img in images:
-            if os.path.exists(img):
+            if img in results:
                 print(f"\n🔍 Testing: {img}")
-                result = detector.detect_morphing(img)
+                result = results[img]
                 
                 if "error" not in result:
                     print(f"Raw Logit: {result['raw_logit']:.6f}")